@@ -0,0 +1,121 @@
+"""
+Startup-time benchmark
+
+Measures, in a fresh interpreter per run:
+  * import time of bot.py
+  * time to create the database schema and build the Application
+  * time-to-first-update: from process start until a synthetic update
+    reaches the Application's dispatcher
+
+Runs offline: the Telegram bot never touches the network and the database
+lives in a temporary directory.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a child process so every run is a cold start
+CHILD_SCRIPT = r'''
+import time
+t_start = time.perf_counter()
+
+import asyncio
+import json
+import sys
+sys.path.insert(0, sys.argv[1])
+
+import bot
+t_imported = time.perf_counter()
+
+from telegram import Update, User
+from telegram.ext import ApplicationHandlerStop, ExtBot, TypeHandler
+
+class OfflineBot(ExtBot):
+    """Bot that answers get_me locally instead of calling Telegram"""
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(id=1, is_bot=True, first_name="bench", username="bench_bot")
+        return self._bot_user
+
+app = bot.build_application(bot=OfflineBot("1:offline"))
+
+first_update_at = []
+
+async def record_first_update(update, context):
+    first_update_at.append(time.perf_counter())
+    # Stop here so the real handlers don't try to reply over the network
+    raise ApplicationHandlerStop
+
+app.add_handler(TypeHandler(Update, record_first_update), group=-1)
+
+async def run():
+    await app.initialize()
+    # run_polling() calls post_init; do the same here
+    await bot.on_startup(app)
+    built_at = time.perf_counter()
+    update = Update.de_json({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+            "text": "Hallo!",
+        },
+    }, app.bot)
+    await app.process_update(update)
+    await app.shutdown()
+    await bot.on_shutdown(app)
+    return built_at
+
+t_built = asyncio.run(run())
+
+print(json.dumps({
+    "import_s": t_imported - t_start,
+    "build_s": t_built - t_imported,
+    "first_update_s": first_update_at[0] - t_start,
+}))
+'''
+
+
+def run_once():
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, TELEGRAM_BOT_TOKEN="1:offline")
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD_SCRIPT, REPO_ROOT],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure")
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+
+    for key, label in [
+        ("import_s", "import bot"),
+        ("build_s", "init db + build app"),
+        ("first_update_s", "time-to-first-update"),
+    ]:
+        values = [r[key] * 1000 for r in results]
+        print(f"{label:<22} median {statistics.median(values):8.1f} ms   "
+              f"min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 import os
 import pytz
-from telegram.ext import JobQueue
 from datetime import time
 from dotenv import load_dotenv
-from util.DatabaseManager import *
-from util.LLMHandler import *
-from util.DailyWordManager import *
+from util.DatabaseManager import DatabaseManager
+from util.LLMHandler import LanguageModelHandler
+from util.DailyWordManager import DailyWordManager
+from util.RetentionManager import RetentionManager
+from util.MessageSender import MessageSender
+from util.SearchManager import SearchManager
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext, JobQueue, CallbackQueryHandler
 import logging
@@ -18,10 +20,22 @@ openai_api_key = os.getenv('OPENAI_API_KEY')
 anthropic_api_key = os.getenv('ANTHROPIC_API_KEY')
 telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
 daily_word_manager = None
+message_sender = None
 
+# Defaults for every Telegram API call, applied to the shared connection pool
 TELEGRAM_TIMEOUT = 30
+TELEGRAM_POOL_SIZE = 64
 
-# Dict to store user preferences for model selection
+# Outbound rate limits, in messages per second
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_PER_CHAT_RATE = 1
+
+# History retention: per-chat row limit, max age and how often to enforce them
+HISTORY_MAX_ROWS_PER_CHAT = int(os.getenv('HISTORY_MAX_ROWS_PER_CHAT', 500))
+HISTORY_MAX_AGE_DAYS = int(os.getenv('HISTORY_MAX_AGE_DAYS', 90))
+RETENTION_INTERVAL_SECONDS = 60 * 60
+
+# Cache of user preferences for model selection, persisted as chat settings
 user_model_preferences = {}
 
 # Available models with friendly display names
@@ -44,12 +58,28 @@ elif not anthropic_api_key:
     logger.error("No Anthropic API key was found!")
 
 db_manager = DatabaseManager()
+retention_manager = RetentionManager(
+    db_manager.storage,
+    max_rows_per_chat=HISTORY_MAX_ROWS_PER_CHAT,
+    max_age_days=HISTORY_MAX_AGE_DAYS
+)
+search_manager = SearchManager(db_manager.storage)
 llm_handler = LanguageModelHandler(
     openai_api_key=openai_api_key,
     anthropic_api_key=anthropic_api_key,
     db_manager=db_manager
 )
 
+async def get_user_model(chat_id):
+    """Return the chat's preferred model, loading it from storage on first use"""
+    if chat_id not in user_model_preferences:
+        user_model_preferences[chat_id] = await db_manager.get_setting(chat_id, "model", DEFAULT_MODEL)
+    return user_model_preferences[chat_id]
+
+async def set_user_model(chat_id, model_name):
+    user_model_preferences[chat_id] = model_name
+    await db_manager.set_setting(chat_id, "model", model_name)
+
 def get_model_selection_keyboard():
     """Create an inline keyboard for model selection"""
     keyboard = []
@@ -98,7 +128,7 @@ async def start(update: Update, context: CallbackContext) -> None:
     chat_id = update.effective_chat.id
     
     # Set default model for this user
-    user_model_preferences[chat_id] = DEFAULT_MODEL
+    await set_user_model(chat_id, DEFAULT_MODEL)
     
     welcome_message = ("Hello! I'm your AI Dutch Language Tutor 🤖\n\n"
                        "I can help you learn Dutch through conversation and practice.\n\n"
@@ -106,18 +136,17 @@ async def start(update: Update, context: CallbackContext) -> None:
                        "Different models have different strengths and speeds.")
     
     # Add chat to daily word recipients
-    daily_word_manager.add_chat(chat_id)
+    await daily_word_manager.add_chat(chat_id)
 
-    # Store the system message if it's not already there
-    if not db_manager.get_user_history():
-        db_manager.store_message("system", llm_handler.system_message)
+    # The system message is not stored: LanguageModelHandler.build_context
+    # always adds the current one, and a stored row would shift the history
+    # window so that it starts on an assistant turn
     
     # Send welcome message with model selection keyboard
-    await update.message.reply_text(
+    await message_sender.reply_text(
+        update.message,
         welcome_message,
-        reply_markup=get_model_selection_keyboard(),
-        read_timeout=TELEGRAM_TIMEOUT,
-        write_timeout=TELEGRAM_TIMEOUT
+        reply_markup=get_model_selection_keyboard()
     )
 
 async def handle_message(update: Update, context: CallbackContext) -> None:
@@ -126,20 +155,24 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
             chat_id = update.effective_chat.id
             user_message = update.message.text
             
+            # Answer "what was that word?" questions from the search index
+            # instead of spending a model call on them
+            local_answer = await search_manager.answer_recall(user_message)
+            if local_answer:
+                await message_sender.reply_text(update.message, local_answer)
+                return
+            
             # Get the user's preferred model or use default
-            model_name = user_model_preferences.get(chat_id, DEFAULT_MODEL)
+            model_name = await get_user_model(chat_id)
             
-            # Show typing indicator
-            await context.bot.send_chat_action(
-                chat_id=chat_id,
-                action="typing"
-            )
-            
-            # Get the AI response using the selected model
-            ai_response = await llm_handler.send_message(
-                prompt=user_message,
-                model_name=model_name
-            )
+            # Get the AI response using the selected model, showing the
+            # typing indicator until it arrives
+            async with message_sender.typing(chat_id):
+                ai_response = await llm_handler.send_message(
+                    prompt=user_message,
+                    model_name=model_name,
+                    chat_id=chat_id
+                )
             
             # Add a small footer with current model info
             response_with_footer = (
@@ -147,63 +180,61 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
                 f"_Using: {AVAILABLE_MODELS[model_name]}_"
             )
             
-            await update.message.reply_text(
+            await message_sender.reply_text(
+                update.message,
                 response_with_footer,
-                parse_mode="Markdown",
-                read_timeout=TELEGRAM_TIMEOUT,
-                write_timeout=TELEGRAM_TIMEOUT,
-                connect_timeout=TELEGRAM_TIMEOUT,
-                pool_timeout=TELEGRAM_TIMEOUT
+                parse_mode="Markdown"
             )
         except Exception as e:
             logger.error(f"Error handling message: {e}")
-            await update.message.reply_text(
-                "Sorry, I encountered an error. Please try again.",
-                read_timeout=TELEGRAM_TIMEOUT,
-                write_timeout=TELEGRAM_TIMEOUT,
-                connect_timeout=TELEGRAM_TIMEOUT,
-                pool_timeout=TELEGRAM_TIMEOUT
+            await message_sender.reply_text(
+                update.message,
+                "Sorry, I encountered an error. Please try again."
             )
     else:
         logger.warning("Received a non-text message, ignoring.")
 
 async def settings_command(update: Update, context: CallbackContext) -> None:
     """Send settings menu with model selection options"""
-    await update.message.reply_text(
+    await message_sender.reply_text(
+        update.message,
         "Settings:\nChoose which AI model you'd like me to use for responses:",
-        reply_markup=get_model_selection_keyboard(),
-        read_timeout=TELEGRAM_TIMEOUT,
-        write_timeout=TELEGRAM_TIMEOUT
+        reply_markup=get_model_selection_keyboard()
     )
 
+async def search_command(update: Update, context: CallbackContext) -> None:
+    """Search learned words and conversation history"""
+    chat_id = update.effective_chat.id
+    query = " ".join(context.args)
+
+    try:
+        results = await search_manager.search(chat_id, query)
+        await message_sender.reply_text(update.message, results)
+    except Exception as e:
+        logger.error(f"Error searching history: {e}")
+        await message_sender.reply_text(
+            update.message,
+            "Sorry, I encountered an error while searching. Please try again."
+        )
+
 async def word_command(update: Update, context: CallbackContext) -> None:
     """Generate and send a word of the day on demand"""
     chat_id = update.effective_chat.id
     
-    # Show typing indicator
-    await context.bot.send_chat_action(
-        chat_id=chat_id,
-        action="typing"
-    )
-    
     # Get the user's preferred model
-    model_name = user_model_preferences.get(chat_id, DEFAULT_MODEL)
+    model_name = await get_user_model(chat_id)
     
     try:
         # Get immediate word using the user's preferred model
-        word_message = await daily_word_manager.get_word_of_the_day(model_name)
+        async with message_sender.typing(chat_id):
+            word_message = await daily_word_manager.get_word_of_the_day(model_name)
         
-        await update.message.reply_text(
-            word_message,
-            read_timeout=TELEGRAM_TIMEOUT,
-            write_timeout=TELEGRAM_TIMEOUT
-        )
+        await message_sender.reply_text(update.message, word_message)
     except Exception as e:
         logger.error(f"Error generating word of the day: {e}")
-        await update.message.reply_text(
-            "Sorry, I encountered an error generating the word of the day. Please try again.",
-            read_timeout=TELEGRAM_TIMEOUT,
-            write_timeout=TELEGRAM_TIMEOUT
+        await message_sender.reply_text(
+            update.message,
+            "Sorry, I encountered an error generating the word of the day. Please try again."
         )
 
 async def button_callback(update: Update, context: CallbackContext) -> None:
@@ -219,75 +250,58 @@ async def button_callback(update: Update, context: CallbackContext) -> None:
         selected_model = query.data.replace("model_", "")
         
         # Store user's model preference
-        user_model_preferences[chat_id] = selected_model
+        await set_user_model(chat_id, selected_model)
         
         # Confirm selection to user
-        await query.edit_message_text(
-            f"Model changed to: {AVAILABLE_MODELS[selected_model]}\n\nYou can change it anytime with /settings",
-            read_timeout=TELEGRAM_TIMEOUT,
-            write_timeout=TELEGRAM_TIMEOUT
+        await message_sender.edit_message_text(
+            query,
+            f"Model changed to: {AVAILABLE_MODELS[selected_model]}\n\nYou can change it anytime with /settings"
         )
         
     elif query.data == "wotd_get":
-        # Show loading indicator
-        await context.bot.send_chat_action(
-            chat_id=chat_id,
-            action="typing"
-        )
-        
         # Get user's preferred model
-        model_name = user_model_preferences.get(chat_id, DEFAULT_MODEL)
+        model_name = await get_user_model(chat_id)
         
         try:
-            # Generate word of the day on demand
-            word_message = await daily_word_manager.get_word_of_the_day(model_name)
+            # Generate word of the day on demand, showing a loading indicator
+            async with message_sender.typing(chat_id):
+                word_message = await daily_word_manager.get_word_of_the_day(model_name)
             
             # Can't edit the button message to include the word (too large),
             # so we'll send a new message
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=word_message,
-                read_timeout=TELEGRAM_TIMEOUT,
-                write_timeout=TELEGRAM_TIMEOUT
-            )
+            await message_sender.send_message(chat_id, word_message)
             
             # Let user know word was generated
-            await query.edit_message_text(
-                f"Generated Word of the Day using {AVAILABLE_MODELS[model_name]}",
-                read_timeout=TELEGRAM_TIMEOUT,
-                write_timeout=TELEGRAM_TIMEOUT
+            await message_sender.edit_message_text(
+                query,
+                f"Generated Word of the Day using {AVAILABLE_MODELS[model_name]}"
             )
         except Exception as e:
             logger.error(f"Error generating word of the day: {e}")
-            await query.edit_message_text(
-                "Sorry, I encountered an error generating the word of the day. Please try again.",
-                read_timeout=TELEGRAM_TIMEOUT,
-                write_timeout=TELEGRAM_TIMEOUT
+            await message_sender.edit_message_text(
+                query,
+                "Sorry, I encountered an error generating the word of the day. Please try again."
             )
             
     elif query.data == "wotd_subscribe":
         # Subscribe to Word of the Day
-        daily_word_manager.add_chat(chat_id)
-        await query.edit_message_text(
-            "You've subscribed to the Dutch Word of the Day! You'll receive a new word daily at 12:00 PM Amsterdam time.\n\nYou can also get a word anytime with the /word command.",
-            read_timeout=TELEGRAM_TIMEOUT,
-            write_timeout=TELEGRAM_TIMEOUT
+        await daily_word_manager.add_chat(chat_id)
+        await message_sender.edit_message_text(
+            query,
+            "You've subscribed to the Dutch Word of the Day! You'll receive a new word daily at 12:00 PM Amsterdam time.\n\nYou can also get a word anytime with the /word command."
         )
         
     elif query.data == "wotd_unsubscribe":
         # Unsubscribe from Word of the Day
-        daily_word_manager.remove_chat(chat_id)
-        await query.edit_message_text(
-            "You've unsubscribed from the Dutch Word of the Day. You can resubscribe anytime with /settings",
-            read_timeout=TELEGRAM_TIMEOUT,
-            write_timeout=TELEGRAM_TIMEOUT
+        await daily_word_manager.remove_chat(chat_id)
+        await message_sender.edit_message_text(
+            query,
+            "You've unsubscribed from the Dutch Word of the Day. You can resubscribe anytime with /settings"
         )
 
 def setup_daily_word(application: Application):
     global daily_word_manager
-    daily_word_manager = DailyWordManager(llm_handler, application.bot)
-    daily_word_manager.init_db()
-    daily_word_manager.load_active_chats()
+    daily_word_manager = DailyWordManager(llm_handler, application.bot, db_manager.storage, message_sender)
 
     # Schedule daily word broadcast
     job_queue = application.job_queue
@@ -302,24 +316,78 @@ def setup_daily_word(application: Application):
         days=(0, 1, 2, 3, 4, 5, 6)  # All days of the week
     )
 
-def main():
-    # Initialize the database
-    db_manager.init_db()
-    
-    app = Application.builder().token(telegram_bot_token).concurrent_updates(True).job_queue(JobQueue()).build()
+def setup_message_sender(application: Application):
+    global message_sender
+    message_sender = MessageSender(
+        application.bot,
+        global_rate=TELEGRAM_GLOBAL_RATE,
+        per_chat_rate=TELEGRAM_PER_CHAT_RATE
+    )
+
+def setup_retention(application: Application):
+    # Archive old turns in the background; first run shortly after startup
+    application.job_queue.run_repeating(
+        retention_manager.enforce_retention,
+        interval=RETENTION_INTERVAL_SECONDS,
+        first=60
+    )
+
+async def on_startup(application: Application):
+    # Connect storage and create all tables in one transaction
+    await db_manager.init_db()
+    await daily_word_manager.load_active_chats()
+
+async def on_shutdown(application: Application):
+    await db_manager.close()
+
+def build_application(bot=None):
+    """Create the Application with all handlers and jobs registered"""
+    if bot:
+        builder = Application.builder().bot(bot)
+    else:
+        # One shared, tuned connection pool and timeouts for all API calls
+        builder = (
+            Application.builder()
+            .token(telegram_bot_token)
+            .connection_pool_size(TELEGRAM_POOL_SIZE)
+            .connect_timeout(TELEGRAM_TIMEOUT)
+            .read_timeout(TELEGRAM_TIMEOUT)
+            .write_timeout(TELEGRAM_TIMEOUT)
+            .pool_timeout(TELEGRAM_TIMEOUT)
+        )
+    app = (
+        builder.concurrent_updates(True)
+        .job_queue(JobQueue())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+
+    # All outbound messages go through the rate-limited sender
+    setup_message_sender(app)
 
     # Set up daily word feature
     setup_daily_word(app)
 
+    # Set up history retention and archival
+    setup_retention(app)
+
     # Command handlers
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("settings", settings_command))
     app.add_handler(CommandHandler("word", word_command))
+    app.add_handler(CommandHandler("search", search_command))
     
     # Message and callback handlers
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(CallbackQueryHandler(button_callback))
 
+    return app
+
+def main():
+    # Storage is connected in on_startup, once the event loop is running
+    app = build_application()
+
     logger.info("🤖 Dutch Language Learning Bot is running...")
     app.run_polling()
 
@@ -0,0 +1,70 @@
+import os
+import sys
+import asyncio
+import pytest
+
+# Make the util package importable when running plain `pytest`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.SQLiteStorage import SQLiteStorage
+
+POSTGRES_TABLES = "messages, messages_archive, active_chats, dutch_words, chat_settings"
+
+@pytest.fixture(scope="session")
+def postgres_dsn(tmp_path_factory):
+    """
+    DSN of the PostgreSQL server the postgres test cases run against
+
+    DATABASE_URL when it is set (e.g. a CI service container), otherwise a
+    throwaway server started with pgserver, which ships the PostgreSQL
+    binaries as a pip package: pip install pgserver asyncpg
+    """
+    dsn = os.getenv("DATABASE_URL")
+    if dsn:
+        yield dsn
+        return
+
+    pgserver = pytest.importorskip("pgserver", reason="DATABASE_URL not set and pgserver not installed")
+    server = pgserver.get_server(tmp_path_factory.mktemp("pgdata"), cleanup_mode="delete")
+    try:
+        yield server.get_uri()
+    finally:
+        server.cleanup()
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def make_storage(request, tmp_path):
+    """
+    Factory for a connected, empty storage backend
+
+    The tables of the PostgreSQL server (see postgres_dsn) are emptied
+    before each test.
+    """
+    if request.param == "postgres":
+        pytest.importorskip("asyncpg")
+        dsn = request.getfixturevalue("postgres_dsn")
+        from util.PostgresStorage import PostgresStorage
+
+    async def make():
+        if request.param == "sqlite":
+            storage = SQLiteStorage(str(tmp_path / "chat_history.db"))
+            await storage.connect()
+        else:
+            storage = PostgresStorage(dsn, min_size=1, max_size=2)
+            await storage.connect()
+            await storage.pool.execute(f"TRUNCATE {POSTGRES_TABLES}")
+        return storage
+
+    return make
+
+@pytest.fixture
+def run_with_storage(make_storage):
+    """Run `scenario(storage)` in a fresh event loop and close the storage afterwards"""
+    def run(scenario):
+        async def main():
+            storage = await make_storage()
+            try:
+                return await scenario(storage)
+            finally:
+                await storage.close()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,133 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from util.DatabaseManager import DatabaseManager
+from util.LLMHandler import LanguageModelHandler
+from util.SQLiteStorage import SQLiteStorage
+
+CACHE = {"type": "ephemeral"}
+
+def history_windows(tmp_path, totals):
+    """Contents of the history window after storing each of `totals` messages"""
+    async def scenario():
+        db = DatabaseManager(SQLiteStorage(str(tmp_path / "chat_history.db")))
+        await db.init_db()
+        windows = {}
+        for i in range(max(totals)):
+            await db.store_message("user" if i % 2 == 0 else "assistant", f"message {i}", chat_id=1)
+            if i + 1 in totals:
+                windows[i + 1] = [msg["content"] for msg in await db.get_user_history(1)]
+        await db.close()
+        return windows
+
+    return asyncio.run(scenario())
+
+def test_history_window_moves_in_steps(tmp_path):
+    windows = history_windows(tmp_path, {40, 41, 50, 51})
+
+    assert windows[40] == [f"message {i}" for i in range(40)]
+    # The start is rounded up to a multiple of 10, so the window shrinks
+    # below the limit instead of sliding by one message per turn
+    assert windows[41] == [f"message {i}" for i in range(10, 41)]
+    assert windows[50] == [f"message {i}" for i in range(10, 50)]
+    assert windows[51] == [f"message {i}" for i in range(20, 51)]
+
+def test_history_window_is_append_only_between_steps(tmp_path):
+    windows = history_windows(tmp_path, set(range(41, 51)))
+
+    for total in range(42, 51):
+        assert windows[total][:-1] == windows[total - 1]
+
+def test_build_context_uses_code_system_prompt_and_starts_on_user_turn():
+    handler = LanguageModelHandler()
+    history = [
+        {"role": "assistant", "content": "orphaned reply"},
+        {"role": "system", "content": "stored prompt"},
+        {"role": "user", "content": "Hallo"},
+        {"role": "assistant", "content": "Hoi!"},
+        {"role": "user", "content": "Hoe gaat het?"},
+    ]
+
+    assert handler.build_context(history) == [
+        {"role": "system", "content": handler.system_message},
+        {"role": "user", "content": "Hallo"},
+        {"role": "assistant", "content": "Hoi!"},
+        {"role": "user", "content": "Hoe gaat het?"},
+    ]
+
+def test_build_context_is_append_only():
+    handler = LanguageModelHandler()
+    history = [{"role": "user", "content": "Hallo"}, {"role": "assistant", "content": "Hoi!"}]
+    longer = history + [{"role": "user", "content": "Dank je"}]
+
+    assert handler.build_context(longer)[:-1] == handler.build_context(history)
+
+def test_anthropic_cache_breakpoints():
+    handler = LanguageModelHandler()
+    messages = handler.build_context([
+        {"role": "user", "content": "Hallo"},
+        {"role": "assistant", "content": "Hoi!"},
+        {"role": "user", "content": "Hoe gaat het?"},
+    ])
+
+    system, anthropic_messages = handler.to_anthropic_messages(messages, prompt_caching=True)
+
+    assert system == [{"type": "text", "text": handler.system_message, "cache_control": CACHE}]
+    # The breakpoint sits on the last message before the new user turn
+    assert anthropic_messages == [
+        {"role": "user", "content": "Hallo"},
+        {"role": "assistant", "content": [{"type": "text", "text": "Hoi!", "cache_control": CACHE}]},
+        {"role": "user", "content": "Hoe gaat het?"},
+    ]
+
+def test_anthropic_cache_breakpoints_for_first_turn():
+    handler = LanguageModelHandler()
+    messages = handler.build_context([{"role": "user", "content": "Hallo"}])
+
+    system, anthropic_messages = handler.to_anthropic_messages(messages, prompt_caching=True)
+
+    assert system[0]["cache_control"] == CACHE
+    assert anthropic_messages == [{"role": "user", "content": "Hallo"}]
+
+def test_anthropic_messages_without_caching():
+    handler = LanguageModelHandler()
+    messages = handler.build_context([
+        {"role": "user", "content": "Hallo"},
+        {"role": "assistant", "content": "Hoi!"},
+        {"role": "user", "content": "Hoe gaat het?"},
+    ])
+
+    system, anthropic_messages = handler.to_anthropic_messages(messages)
+
+    assert system == handler.system_message
+    assert anthropic_messages == messages[1:]
+
+def test_usage_accounting_is_consistent_across_providers():
+    handler = LanguageModelHandler()
+    # The same 1500 token prompt, 1024 of them from the cache
+    openai = SimpleNamespace(prompt_tokens=1500, prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+    anthropic = SimpleNamespace(input_tokens=476, cache_read_input_tokens=1024, cache_creation_input_tokens=0)
+
+    expected = {"input_tokens": 476, "cache_read_tokens": 1024, "cache_write_tokens": 0, "total_input_tokens": 1500}
+    assert handler.record_usage("gpt-4o", **handler.openai_usage(openai)) == expected
+    assert handler.record_usage("claude-3.5-sonnet", **handler.anthropic_usage(anthropic)) == expected
+
+def test_usage_without_cache_details():
+    handler = LanguageModelHandler()
+    openai = SimpleNamespace(prompt_tokens=300, prompt_tokens_details=None)
+    anthropic = SimpleNamespace(input_tokens=300, cache_read_input_tokens=None, cache_creation_input_tokens=None)
+
+    assert handler.openai_usage(openai) == {"input_tokens": 300, "cache_read_tokens": 0}
+    assert handler.anthropic_usage(anthropic) == {"input_tokens": 300, "cache_read_tokens": 0, "cache_write_tokens": 0}
+
+def test_usage_totals_per_model():
+    handler = LanguageModelHandler()
+    handler.record_usage("claude-3.5-sonnet", input_tokens=100, cache_write_tokens=1000)
+    handler.record_usage("claude-3.5-sonnet", input_tokens=50, cache_read_tokens=1000)
+
+    assert handler.usage_totals == {
+        "claude-3.5-sonnet": {
+            "calls": 2, "input_tokens": 150, "cache_read_tokens": 1000,
+            "cache_write_tokens": 1000, "total_input_tokens": 2150
+        }
+    }
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from util.SearchManager import SearchManager
+
+class FakeStorage:
+    """Word lookups for SearchManager, recording the searched terms"""
+
+    def __init__(self, words=()):
+        self.words = list(words)
+        self.searches = []
+
+    async def get_used_words(self, limit):
+        return [word[:2] for word in self.words[:limit]]
+
+    async def search_words(self, terms, limit):
+        self.searches.append(terms)
+        return [word for word in self.words if any(term in " ".join(word).lower() for term in terms)][:limit]
+
+WORDS = [("fiets", "bicycle", "Ik fiets naar school."), ("huis", "house", "Het huis is groot.")]
+
+@pytest.mark.parametrize("text", [
+    "What was the word for bicycle again?",
+    "what was that word we did last week",
+    "Which words did we learn yesterday?",
+    "Hmm, what were those words again?",
+    "Thanks! What was the word for house",
+    "Wat was het woord voor fiets?",
+    "wat was dat woord van vorige week",
+    "Welke woorden hebben we gisteren geleerd?",
+    "Hm, wat waren die woorden ook alweer?",
+    "Dank je! Wat was het woord voor huis",
+])
+def test_recall_questions(text):
+    assert SearchManager(FakeStorage()).is_recall_query(text)
+
+@pytest.mark.parametrize("text", [
+    "What is the word for bicycle?",
+    "Wat is het woord voor fiets?",
+    "The words we learned are hard",
+    "De woorden die we geleerd hebben zijn moeilijk",
+    "I forgot what was the word for it, but that's fine",
+    "Ik weet niet meer wat het woord was",
+    "Which word is correct here?",
+    "Welk woord is hier correct?",
+])
+def test_not_recall_questions(text):
+    assert not SearchManager(FakeStorage()).is_recall_query(text)
+
+def test_recall_answer_from_matching_words():
+    storage = FakeStorage(WORDS)
+    answer = asyncio.run(SearchManager(storage).answer_recall("What was the word for bicycle again?"))
+
+    assert storage.searches == [["bicycle"]]
+    assert answer == "📚 Matching words of the day:\n• fiets - bicycle\n  Ik fiets naar school."
+
+def test_recall_answer_lists_recent_words_without_a_hint():
+    answer = asyncio.run(SearchManager(FakeStorage(WORDS)).answer_recall("Welke woorden hebben we geleerd?"))
+
+    assert answer == "📚 Recent words of the day:\n• fiets - bicycle\n• huis - house"
+
+def test_recall_without_matching_word_goes_to_the_tutor():
+    storage = FakeStorage(WORDS)
+
+    assert asyncio.run(SearchManager(storage).answer_recall("Wat was het woord voor appel?")) is None
+    assert asyncio.run(SearchManager(storage).answer_recall("The words we learned are hard")) is None
+    assert storage.searches == [["appel"]]
@@ -0,0 +1,156 @@
+import zlib
+import pytest
+from datetime import datetime, timedelta
+from util.StorageBackend import DuplicateWordError
+
+def compress(content):
+    return zlib.compress(content.encode('utf-8'))
+
+def test_store_get_and_count_messages(run_with_storage):
+    async def scenario(storage):
+        now = datetime.now()
+        await storage.store_message(1, "system", "prompt", now)
+        for i in range(5):
+            await storage.store_message(1, "user", f"vraag {i}", now)
+        await storage.store_message(2, "user", "other chat", now)
+        await storage.store_message(None, "user", "legacy", now)
+
+        assert await storage.count_messages(1) == 6
+        assert await storage.count_messages(2) == 1
+        assert await storage.count_messages(None) == 1
+        assert await storage.get_messages(1, 3) == [("system", "prompt"), ("user", "vraag 0"), ("user", "vraag 1")]
+        assert await storage.get_messages(1, 2, offset=4) == [("user", "vraag 3"), ("user", "vraag 4")]
+        assert await storage.get_messages(None, 10) == [("user", "legacy")]
+
+    run_with_storage(scenario)
+
+def test_archive_expired_messages_and_read_back(run_with_storage):
+    async def scenario(storage):
+        now = datetime.now()
+        await storage.store_message(1, "system", "prompt", now)
+        await storage.store_message(1, "user", "ancient", now - timedelta(days=400))
+        for i in range(12):
+            await storage.store_message(1, "user", f"vraag {i}", now)
+        for i in range(3):
+            await storage.store_message(2, "user", f"kort {i}", now)
+
+        cutoff = now - timedelta(days=90)
+        total = 0
+        while True:
+            moved = await storage.archive_expired_messages(10, cutoff, 4, compress)
+            if not moved:
+                break
+            total += moved
+
+        # "ancient" and vraag 0-1 exceed the limit of 10; the system prompt stays
+        assert total == 3
+        assert await storage.count_messages(1) == 11
+        assert await storage.count_messages(2) == 3
+        remaining = await storage.get_messages(1, 2)
+        assert remaining == [("system", "prompt"), ("user", "vraag 2")]
+
+        archived = await storage.get_archived_messages(1, 10)
+        assert [(role, zlib.decompress(content).decode('utf-8')) for role, content, _ in archived] == [
+            ("user", "vraag 1"), ("user", "vraag 0"), ("user", "ancient")
+        ]
+        assert await storage.get_archived_messages(2, 10) == []
+
+        await storage.reclaim_space()
+
+    run_with_storage(scenario)
+
+def test_archive_sweeps_every_chat(run_with_storage):
+    async def scenario(storage):
+        now = datetime.now()
+        for chat_id in (None, -5, 3, 8):
+            await storage.store_message(chat_id, "user", "old", now - timedelta(days=400))
+            for i in range(4):
+                await storage.store_message(chat_id, "user", f"vraag {i}", now)
+
+        # Batches smaller than a chat's backlog resume at the next chat
+        moved = []
+        while True:
+            count = await storage.archive_expired_messages(3, now - timedelta(days=90), 3, compress)
+            if not count:
+                break
+            moved.append(count)
+
+        assert sum(moved) == 8
+        for chat_id in (None, -5, 3, 8):
+            assert await storage.get_messages(chat_id, 10) == [
+                ("user", "vraag 1"), ("user", "vraag 2"), ("user", "vraag 3")
+            ]
+
+    run_with_storage(scenario)
+
+def test_active_chats(run_with_storage):
+    async def scenario(storage):
+        await storage.set_chat_active(1, True)
+        await storage.set_chat_active(2, True)
+        await storage.set_chat_active(3, True)
+        await storage.set_chat_active(2, False)
+
+        assert sorted([chat_id async for chat_id in storage.iter_active_chats()]) == [1, 3]
+
+    run_with_storage(scenario)
+
+def test_duplicate_word(run_with_storage):
+    async def scenario(storage):
+        await storage.store_word("huis", "house", "Het huis is groot.")
+        await storage.store_word("fiets", "bicycle")
+
+        with pytest.raises(DuplicateWordError):
+            await storage.store_word("huis", "home")
+
+        assert sorted(await storage.get_used_words(10)) == [("fiets", "bicycle"), ("huis", "house")]
+
+    run_with_storage(scenario)
+
+def test_settings(run_with_storage):
+    async def scenario(storage):
+        assert await storage.get_setting(1, "model") is None
+        assert await storage.get_setting(1, "model", "gpt-4o-mini") == "gpt-4o-mini"
+
+        await storage.set_setting(1, "model", "gpt-4o")
+        await storage.set_setting(1, "model", "claude-3-opus")
+        await storage.set_setting(2, "model", "gpt-4o")
+
+        assert await storage.get_setting(1, "model") == "claude-3-opus"
+        assert await storage.get_setting(2, "model") == "gpt-4o"
+
+    run_with_storage(scenario)
+
+def test_search_messages(run_with_storage):
+    async def scenario(storage):
+        now = datetime.now()
+        await storage.store_message(1, "system", "You are a kind Dutch language teacher", now)
+        await storage.store_message(1, "user", "Hoe zeg je bicycle?", now)
+        await storage.store_message(1, "assistant", "Dat is fiets, een Dutch word", now)
+        await storage.store_message(2, "user", "Mijn fiets is rood", now)
+        await storage.store_message(-1, "user", "Een fiets in de groep", now)
+
+        results = await storage.search_messages(1, ["fiet"], 5)
+        assert [(role, content) for role, content, _ in results] == [("assistant", "Dat is fiets, een Dutch word")]
+        # One-letter terms only match whole words
+        assert await storage.search_messages(1, ["f"], 5) == []
+        # The stored system prompt is not searchable
+        assert await storage.search_messages(1, ["teacher"], 5) == []
+        assert [content for _, content, _ in await storage.search_messages(1, ["dutch"], 5)] == [
+            "Dat is fiets, een Dutch word"
+        ]
+        assert [content for _, content, _ in await storage.search_messages(2, ["fiets"], 5)] == ["Mijn fiets is rood"]
+        # Group chats have negative IDs that must not match the positive ones
+        assert [content for _, content, _ in await storage.search_messages(-1, ["fiets"], 5)] == ["Een fiets in de groep"]
+
+    run_with_storage(scenario)
+
+def test_search_words(run_with_storage):
+    async def scenario(storage):
+        await storage.store_word("huis", "house", "Het huis is groot.")
+        await storage.store_word("fiets", "bicycle", "Ik heb een fiets.")
+
+        assert [row[:2] for row in await storage.search_words(["hous"], 5)] == [("huis", "house")]
+        assert [row[:2] for row in await storage.search_words(["groot"], 5)] == [("huis", "house")]
+        assert await storage.search_words(["auto"], 5) == []
+
+    run_with_storage(scenario)
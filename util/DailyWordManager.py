@@ -1,91 +1,61 @@
+import asyncio
 import logging
 from datetime import time, datetime
-import sqlite3
+from util.StorageBackend import DuplicateWordError
+from util.MessageSender import BULK
 
 logger = logging.getLogger(__name__)
 
 class DailyWordManager:
-    def __init__(self, llm_handler, bot, model_name="gpt-4o-mini"):
+    def __init__(self, llm_handler, bot, storage, sender, model_name="gpt-4o-mini"):
         self.llm_handler = llm_handler
         self.bot = bot
+        self.storage = storage
+        self.sender = sender
+        # Chats sent to concurrently; the sender's rate limits pace the actual sends
+        self.broadcast_batch_size = 100
         self.active_chats = set()
-        self.db_name = 'chat_history.db'
         self.model_name = model_name
 
-    def init_db(self):
-        """Initialize database table for storing chat IDs"""
-        conn = sqlite3.connect(self.db_name)
-        c = conn.cursor()
-        
-        # Create active chats table
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS active_chats (
-                chat_id INTEGER PRIMARY KEY,
-                is_active BOOLEAN DEFAULT TRUE
-            )
-        ''')
-
-        # Create words history table
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS dutch_words (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                word TEXT NOT NULL UNIQUE,
-                translation TEXT NOT NULL,
-                date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')        
-        
-        conn.commit()
-        conn.close()
-
-    def get_used_words(self):
+    async def get_used_words(self):
         """Get list of previously used Dutch words"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('SELECT word, translation FROM dutch_words ORDER BY date_added DESC LIMIT 100')
-            words = c.fetchall()
-            conn.close()
-            return words
-        except sqlite3.Error as e:
+            return await self.storage.get_used_words(100)
+        except Exception as e:
             logger.error(f"Error getting used words: {e}")
             return []
         
-    def store_word(self, word_data):
-        """Store new word in database"""
+    async def store_word(self, word_data):
+        """Store new word in database, raises DuplicateWordError if already used"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO dutch_words (word, translation)
-                VALUES (?, ?)
-            ''', (word_data['word'], word_data['translation']))
-            conn.commit()
-            conn.close()
+            await self.storage.store_word(
+                word_data['word'],
+                word_data['translation'],
+                word_data.get('usage_example')
+            )
             logger.info(f"Stored new word: {word_data['word']}")
-        except sqlite3.Error as e:
+        except DuplicateWordError:
+            raise
+        except Exception as e:
             logger.error(f"Error storing word: {e}")
 
-    def load_active_chats(self):
+    async def load_active_chats(self):
         """Load active chat IDs from database"""
-        conn = sqlite3.connect(self.db_name)
-        c = conn.cursor()
-        c.execute('SELECT chat_id FROM active_chats WHERE is_active = TRUE')
-        chats = c.fetchall()
-        conn.close()
-        self.active_chats = set(chat[0] for chat in chats)
+        self.active_chats = set([chat_id async for chat_id in self.storage.iter_active_chats()])
         logger.info(f"Loaded {len(self.active_chats)} active chats")
 
-    def add_chat(self, chat_id):
+    async def add_chat(self, chat_id):
         """Add a new chat to receive daily words"""
-        conn = sqlite3.connect(self.db_name)
-        c = conn.cursor()
-        c.execute('INSERT OR REPLACE INTO active_chats (chat_id, is_active) VALUES (?, TRUE)', (chat_id,))
-        conn.commit()
-        conn.close()
+        await self.storage.set_chat_active(chat_id, True)
         self.active_chats.add(chat_id)
         logger.info(f"Added chat {chat_id} to daily word list")
 
+    async def remove_chat(self, chat_id):
+        """Stop sending daily words to a chat"""
+        await self.storage.set_chat_active(chat_id, False)
+        self.active_chats.discard(chat_id)
+        logger.info(f"Removed chat {chat_id} from daily word list")
+
     def parse_word_response(self, response):
         """Parse GPT response into structured word data"""
         word_data = {
@@ -124,7 +94,7 @@ class DailyWordManager:
         while current_try < max_retries:
             try:
                 # Get previously used words
-                used_words = self.get_used_words()
+                used_words = await self.get_used_words()
                 used_words_str = ', '.join([f"{word[0]} ({word[1]})" for word in used_words])
 
                 prompt = f"""Generate a Dutch Word of the Day using exactly this format:
@@ -160,7 +130,7 @@ Requirements:
 
                 try:
                     # Try to store the word
-                    self.store_word(word_data)
+                    await self.store_word(word_data)
 
                     # If storage succeeded, format and return the response
                     formatted_response = f"""🎯 Dutch Word of the Day:
@@ -174,7 +144,7 @@ Pronunciation tip: {word_data['pronunciation']}"""
                     logger.info("Successfully generated and stored word of the day")
                     return formatted_response
 
-                except sqlite3.IntegrityError as e:
+                except DuplicateWordError:
                     logger.warning(f"Duplicate word found: {word_data['word']}, retrying...")
                     current_try += 1
                     if current_try >= max_retries:
@@ -191,16 +161,20 @@ Pronunciation tip: {word_data['pronunciation']}"""
 
         return "Sorry, couldn't generate a unique Word of the Day after multiple attempts. Please try again later."
         
+    async def send_word_to_chat(self, chat_id, word_message):
+        """Send the word to one chat, logging failures"""
+        try:
+            # Bulk lane, so interactive replies are never queued behind the broadcast
+            await self.sender.send_message(chat_id, word_message, priority=BULK)
+            logger.info(f"Sent word of the day to chat {chat_id}")
+        except Exception as e:
+            logger.error(f"Failed to send word to chat {chat_id}: {e}")
+
     async def broadcast_word(self, context, model_name=None):
         """Send word of the day to all active chats"""
         word_message = await self.get_word_of_the_day(model_name)
         
-        for chat_id in self.active_chats:
-            try:
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=word_message
-                )
-                logger.info(f"Sent word of the day to chat {chat_id}")
-            except Exception as e:
-                logger.error(f"Failed to send word to chat {chat_id}: {e}")
\ No newline at end of file
+        chat_ids = list(self.active_chats)
+        for start in range(0, len(chat_ids), self.broadcast_batch_size):
+            batch = chat_ids[start:start + self.broadcast_batch_size]
+            await asyncio.gather(*(self.send_word_to_chat(chat_id, word_message) for chat_id in batch))
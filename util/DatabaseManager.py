@@ -1,63 +1,51 @@
-import sqlite3
 import logging
 from datetime import datetime
+from util.StorageBackend import create_storage_backend
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_name = 'chat_history.db'
+    def __init__(self, storage=None):
+        # Backend is chosen by STORAGE_BACKEND unless one is passed in
+        self.storage = storage or create_storage_backend()
         self.message_history_limit = 40
+        # The history window only moves forward in steps of this many rows,
+        # so between steps each prompt extends the previous one unchanged
+        # and providers can serve the shared prefix from their prompt cache
+        self.message_history_step = 10
 
-    def init_db(self):
-        conn = sqlite3.connect(self.db_name)
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                role TEXT,
-                content TEXT,
-                timestamp DATETIME
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
-    def store_message(self, role, content):
+    async def init_db(self):
+        """Connect to the storage backend and create all tables in one transaction"""
+        await self.storage.connect()
+
+    async def close(self):
+        await self.storage.close()
+
+    async def store_message(self, role, content, chat_id=None):
         # Skip storing if content contains "Dutch Word of the Day"
         if "Dutch Word of the Day" in content:
             logger.info("Skipping storage of daily word message")
             return
     
         try:
-            conn = sqlite3.connect(self.db_name)
-            c = conn.cursor()
-            
-            c.execute('''
-                INSERT INTO messages (role, content, timestamp)
-                VALUES (?, ?, ?)
-            ''', (role, content, datetime.now().isoformat()))
-            
-            conn.commit()
+            await self.storage.store_message(chat_id, role, content, datetime.now())
             logger.info(f"Stored message - Role: {role}, Content: {content[:50]}...")
             
-        except sqlite3.Error as e:
+        except Exception as e:
             logger.error(f"Database error: {e}")
-        finally:
-            conn.close()
 
-    def get_user_history(self):
-        conn = sqlite3.connect(self.db_name)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT role, content 
-            FROM messages 
-            ORDER BY timestamp ASC
-            LIMIT ?
-        ''', (self.message_history_limit,))
-        
-        messages = c.fetchall()
-        conn.close()
+    async def get_user_history(self, chat_id=None):
+        """Return the chat's most recent messages (at most message_history_limit), oldest first"""
+        total = await self.storage.count_messages(chat_id)
+        step = self.message_history_step
+        # Round the window start up to a multiple of step
+        start = -(-max(0, total - self.message_history_limit) // step) * step
+        messages = await self.storage.get_messages(chat_id, self.message_history_limit, start)
         
         return [{"role": msg[0], "content": msg[1]} for msg in messages]
+
+    async def get_setting(self, chat_id, key, default=None):
+        return await self.storage.get_setting(chat_id, key, default)
+
+    async def set_setting(self, chat_id, key, value):
+        await self.storage.set_setting(chat_id, key, value)
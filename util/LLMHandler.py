@@ -1,14 +1,16 @@
 import logging
-from util.DatabaseManager import *
-from openai import OpenAI
-from anthropic import Anthropic
 
 logger = logging.getLogger(__name__)
 
 class LanguageModelHandler:
     def __init__(self, openai_api_key=None, anthropic_api_key=None, db_manager=None):
-        self.openai_client = OpenAI(api_key=openai_api_key) if openai_api_key else None
-        self.anthropic_client = Anthropic(api_key=anthropic_api_key) if anthropic_api_key else None
+        # Provider SDKs are slow to import, so clients are created on first use
+        self.openai_api_key = openai_api_key
+        self.anthropic_api_key = anthropic_api_key
+        self._openai_client = None
+        self._anthropic_client = None
+        # Running prompt token totals per model
+        self.usage_totals = {}
         self.db_manager = db_manager
         self.system_message = """You are a kind and patient Dutch language teacher, helping beginners learn Dutch in a simple, clear, and encouraging way.
 
@@ -46,29 +48,49 @@ Use 70% Dutch and 30% English for immersion, but always translate if the user re
                 "provider": "anthropic",
                 "temperature": 0.7,
                 "max_tokens": 2000,
+                "prompt_caching": True,
                 "api_model": "claude-3-opus-20240229"  # Specific API model name
             },
             "claude-3-sonnet": {
                 "provider": "anthropic",
                 "temperature": 0.7,
                 "max_tokens": 2000,
+                "prompt_caching": False,  # Not offered for this model
                 "api_model": "claude-3-sonnet-20240229"  # Specific API model name
             },
             "claude-3.5-sonnet": {
                 "provider": "anthropic",
                 "temperature": 0.7,
                 "max_tokens": 2000,
+                "prompt_caching": True,
                 "api_model": "claude-3-5-sonnet-20240620"  # Specific API model name
             },
             "claude-3.7-sonnet": {
                 "provider": "anthropic",
                 "temperature": 0.7,
                 "max_tokens": 2000,
+                "prompt_caching": True,
                 "api_model": "claude-3-haiku-20240307"  # Temporary fallback since 3.7 might not be available yet
             }
         }
 
-    async def send_message(self, prompt, model_name="gpt-4o-mini", store_history=True, **kwargs):
+    @property
+    def openai_client(self):
+        """OpenAI client, imported and constructed on first access"""
+        if self._openai_client is None and self.openai_api_key:
+            from openai import OpenAI
+            self._openai_client = OpenAI(api_key=self.openai_api_key)
+        return self._openai_client
+
+    @property
+    def anthropic_client(self):
+        """Anthropic client, imported and constructed on first access"""
+        if self._anthropic_client is None and self.anthropic_api_key:
+            from anthropic import Anthropic
+            self._anthropic_client = Anthropic(api_key=self.anthropic_api_key)
+        return self._anthropic_client
+
+    async def send_message(self, prompt, model_name="gpt-4o-mini", store_history=True, chat_id=None, **kwargs):
         """
         Send a message to the specified language model
         
@@ -76,6 +98,7 @@ Use 70% Dutch and 30% English for immersion, but always translate if the user re
             prompt (str): The user's message
             model_name (str): The model to use
             store_history (bool): Whether to store and use conversation history
+            chat_id (int): The chat whose history is stored and used
             **kwargs: Additional parameters to override default model settings
             
         Returns:
@@ -96,17 +119,14 @@ Use 70% Dutch and 30% English for immersion, but always translate if the user re
             
             # Store the user's message if history is enabled
             if store_history and self.db_manager:
-                self.db_manager.store_message("user", prompt)
+                await self.db_manager.store_message("user", prompt, chat_id)
             
             # Prepare messages with or without history
             messages = []
             if store_history and self.db_manager:
-                messages = self.db_manager.get_user_history()
-                logger.info(f"Using conversation history with {len(messages)} messages")
-                
-                # Add system message if not present
-                if not messages or messages[0]["role"] != "system":
-                    messages.insert(0, {"role": "system", "content": self.system_message})
+                history = await self.db_manager.get_user_history(chat_id)
+                messages = self.build_context(history)
+                logger.info(f"Using conversation history with {len(messages) - 1} messages")
             else:
                 # Just use the current prompt without history
                 messages = [
@@ -131,6 +151,7 @@ Use 70% Dutch and 30% English for immersion, but always translate if the user re
                     max_tokens=model_config.get("max_tokens", 1000)
                 )
                 ai_response = response.choices[0].message.content
+                self.record_usage(model_name, **self.openai_usage(response.usage))
                 
             elif provider == "anthropic":
                 if not self.anthropic_client:
@@ -140,16 +161,10 @@ Use 70% Dutch and 30% English for immersion, but always translate if the user re
                 actual_model = model_config.get("api_model", model_name)
                 
                 # Convert OpenAI message format to Anthropic format
-                anthropic_messages = []
-                system_content = None
-                
-                for msg in messages:
-                    if msg["role"] == "system":
-                        system_content = msg["content"]
-                    elif msg["role"] == "user":
-                        anthropic_messages.append({"role": "user", "content": msg["content"]})
-                    elif msg["role"] == "assistant":
-                        anthropic_messages.append({"role": "assistant", "content": msg["content"]})
+                system_content, anthropic_messages = self.to_anthropic_messages(
+                    messages,
+                    prompt_caching=model_config.get("prompt_caching", False)
+                )
                 
                 logger.info(f"Sending request to Anthropic with model: {actual_model}")
                 response = self.anthropic_client.messages.create(
@@ -160,13 +175,14 @@ Use 70% Dutch and 30% English for immersion, but always translate if the user re
                     max_tokens=model_config.get("max_tokens", 1000)
                 )
                 ai_response = response.content[0].text
+                self.record_usage(model_name, **self.anthropic_usage(response.usage))
                 
             else:
                 return f"Unsupported provider: {provider}"
             
             # Store the AI's response if we're using history
             if store_history and self.db_manager:
-                self.db_manager.store_message("assistant", ai_response)
+                await self.db_manager.store_message("assistant", ai_response, chat_id)
                 
             return ai_response
             
@@ -182,6 +198,125 @@ Use 70% Dutch and 30% English for immersion, but always translate if the user re
             else:
                 return f"Sorry, I encountered an error with {model_name}: {error_message}"
     
+    def build_context(self, history):
+        """
+        Build the message list for a conversation
+
+        The system prompt always comes from code and stored system rows are
+        dropped, so for an unchanged history window each call produces the
+        previous call's messages plus the new turns, byte for byte. Rows
+        before the window's first user turn are dropped as well, so the
+        conversation never opens with an orphaned assistant reply.
+
+        Args:
+            history (list): Stored messages, oldest first
+
+        Returns:
+            list: Messages in OpenAI format
+        """
+        messages = [{"role": "system", "content": self.system_message}]
+        for msg in history:
+            if msg["role"] not in ("user", "assistant"):
+                continue
+            if len(messages) == 1 and msg["role"] != "user":
+                continue
+            messages.append({"role": msg["role"], "content": msg["content"]})
+        return messages
+
+    def to_anthropic_messages(self, messages, prompt_caching=False):
+        """
+        Convert OpenAI-format messages to Anthropic's system prompt and messages
+
+        With prompt_caching, cache breakpoints are placed on the system prompt
+        and on the last message before the new user turn, so the next call in
+        the conversation can read everything up to there from the cache.
+
+        Returns:
+            tuple: (system, messages) for anthropic_client.messages.create
+        """
+        system_content = None
+        anthropic_messages = []
+
+        for msg in messages:
+            if msg["role"] == "system":
+                system_content = msg["content"]
+            elif msg["role"] in ("user", "assistant"):
+                anthropic_messages.append({"role": msg["role"], "content": msg["content"]})
+
+        if not prompt_caching:
+            return system_content, anthropic_messages
+
+        if system_content:
+            system_content = [{
+                "type": "text",
+                "text": system_content,
+                "cache_control": {"type": "ephemeral"}
+            }]
+
+        if len(anthropic_messages) >= 2:
+            older = anthropic_messages[-2]
+            older["content"] = [{
+                "type": "text",
+                "text": older["content"],
+                "cache_control": {"type": "ephemeral"}
+            }]
+
+        return system_content, anthropic_messages
+
+    @staticmethod
+    def openai_usage(usage):
+        """record_usage() arguments for an OpenAI response's usage"""
+        # OpenAI caches long prompt prefixes automatically and only reports
+        # reads; its prompt_tokens includes them, Anthropic's input_tokens doesn't
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        return {
+            "input_tokens": usage.prompt_tokens - cached_tokens,
+            "cache_read_tokens": cached_tokens
+        }
+
+    @staticmethod
+    def anthropic_usage(usage):
+        """record_usage() arguments for an Anthropic response's usage"""
+        return {
+            "input_tokens": usage.input_tokens,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0
+        }
+
+    def record_usage(self, model_name, input_tokens=0, cache_read_tokens=0, cache_write_tokens=0):
+        """
+        Log prompt token usage of a call and add it to the per-model totals
+
+        Args:
+            input_tokens (int): Prompt tokens neither read from nor written to the cache
+            cache_read_tokens (int): Prompt tokens read from the cache
+            cache_write_tokens (int): Prompt tokens written to the cache
+
+        Returns:
+            dict: The call's usage, including total_input_tokens
+        """
+        usage = {
+            "input_tokens": input_tokens,
+            "cache_read_tokens": cache_read_tokens,
+            "cache_write_tokens": cache_write_tokens,
+            "total_input_tokens": input_tokens + cache_read_tokens + cache_write_tokens
+        }
+        totals = self.usage_totals.setdefault(
+            model_name,
+            {"calls": 0, "input_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0, "total_input_tokens": 0}
+        )
+        totals["calls"] += 1
+        for key, value in usage.items():
+            totals[key] += value
+
+        logger.info(
+            f"Prompt usage for {model_name} - uncached input: {input_tokens}, "
+            f"cache read: {cache_read_tokens}, cache write: {cache_write_tokens}, "
+            f"total input: {usage['total_input_tokens']}"
+        )
+        return usage
+
     def get_available_models(self):
         """
         Returns a list of available models based on configured API keys
@@ -194,9 +329,9 @@ Use 70% Dutch and 30% English for immersion, but always translate if the user re
         for model_name, config in self.model_configs.items():
             provider = config["provider"]
             
-            if provider == "openai" and self.openai_client:
+            if provider == "openai" and self.openai_api_key:
                 available_models["openai"].append(model_name)
-            elif provider == "anthropic" and self.anthropic_client:
+            elif provider == "anthropic" and self.anthropic_api_key:
                 available_models["anthropic"].append(model_name)
                 
         return available_models
\ No newline at end of file
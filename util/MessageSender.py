@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower goes first
+INTERACTIVE = 0
+BULK = 1
+
+class PriorityRateLimiter:
+    """
+    Token bucket whose waiters are served strictly by priority
+
+    A waiting BULK acquirer never gets a token while an INTERACTIVE one is
+    queued, so replies to users are not held up by broadcasts.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._wakeup = None
+
+    def _refill(self):
+        now = time.monotonic()
+        # updated_at lies ahead while paused
+        if now > self.updated_at:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def _serve(self):
+        self._wakeup = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+
+        if self._waiters:
+            paused_for = max(0, self.updated_at - time.monotonic())
+            delay = paused_for + (1 - self.tokens) / self.rate
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._serve)
+
+    async def acquire(self, priority=INTERACTIVE):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._wakeup is None:
+            self._serve()
+        await future
+
+    def pause(self, delay):
+        """Hand out no tokens for `delay` seconds, then refill from empty"""
+        self.tokens = 0
+        self.updated_at = max(self.updated_at, time.monotonic() + delay)
+
+    def is_idle(self):
+        """True when nobody is waiting and the bucket has refilled completely"""
+        self._refill()
+        return not self._waiters and self.tokens >= self.burst
+
+class MessageSender:
+    """
+    Single path for outbound Telegram traffic
+
+    Every send goes through a global and a per-chat rate limit, both with
+    priority lanes. Chat actions only count towards the global limit.
+    """
+
+    def __init__(self, bot, global_rate=30, per_chat_rate=1, typing_interval=4.5):
+        self.bot = bot
+        self.global_limiter = PriorityRateLimiter(global_rate, burst=global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.chat_limiters = {}
+        # Telegram shows "typing" for 5 seconds, refresh it a little earlier
+        self.typing_interval = typing_interval
+        self._typing_tasks = {}
+        self._typing_refs = {}
+        self._sends_since_prune = 0
+
+    def _chat_limiter(self, chat_id):
+        limiter = self.chat_limiters.get(chat_id)
+        if limiter is None:
+            limiter = self.chat_limiters[chat_id] = PriorityRateLimiter(self.per_chat_rate)
+        return limiter
+
+    def _prune_chat_limiters(self):
+        self._sends_since_prune += 1
+        if self._sends_since_prune < 1000:
+            return
+        self._sends_since_prune = 0
+        for chat_id in [chat_id for chat_id, limiter in self.chat_limiters.items() if limiter.is_idle()]:
+            del self.chat_limiters[chat_id]
+
+    async def _send(self, chat_id, call, priority):
+        """Wait for both rate limits, then run `call`, retrying once on flood control"""
+        if chat_id is not None:
+            await self._chat_limiter(chat_id).acquire(priority)
+        await self.global_limiter.acquire(priority)
+        self._prune_chat_limiters()
+
+        try:
+            return await call()
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after
+            logger.warning(f"Flood control for chat {chat_id}, retrying in {delay}s")
+            # Hold back every queued send, not just this one, so they don't
+            # all hit Telegram again the moment the wait is over
+            self.global_limiter.pause(delay)
+            await self.global_limiter.acquire(priority)
+            return await call()
+
+    async def send_message(self, chat_id, text, priority=INTERACTIVE, **kwargs):
+        return await self._send(
+            chat_id,
+            lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs),
+            priority
+        )
+
+    async def reply_text(self, message, text, priority=INTERACTIVE, **kwargs):
+        return await self._send(
+            message.chat_id,
+            lambda: message.reply_text(text, **kwargs),
+            priority
+        )
+
+    async def edit_message_text(self, query, text, priority=INTERACTIVE, **kwargs):
+        return await self._send(
+            query.message.chat_id if query.message else None,
+            lambda: query.edit_message_text(text, **kwargs),
+            priority
+        )
+
+    async def _keep_typing(self, chat_id):
+        while True:
+            try:
+                await self.global_limiter.acquire(INTERACTIVE)
+                await self.bot.send_chat_action(chat_id=chat_id, action="typing")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to send typing action to chat {chat_id}: {e}")
+            await asyncio.sleep(self.typing_interval)
+
+    @asynccontextmanager
+    async def typing(self, chat_id):
+        """
+        Show "typing" in a chat for as long as the block runs
+
+        Nested or concurrent blocks for the same chat share one refresh loop,
+        so the action is never sent twice at once.
+        """
+        self._typing_refs[chat_id] = self._typing_refs.get(chat_id, 0) + 1
+        if chat_id not in self._typing_tasks:
+            self._typing_tasks[chat_id] = asyncio.create_task(self._keep_typing(chat_id))
+        try:
+            yield
+        finally:
+            self._typing_refs[chat_id] -= 1
+            if not self._typing_refs[chat_id]:
+                del self._typing_refs[chat_id]
+                self._typing_tasks.pop(chat_id).cancel()
@@ -0,0 +1,293 @@
+import logging
+import asyncpg
+from util.StorageBackend import StorageBackend, DuplicateWordError, MIN_PREFIX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# Positions of the retention sweep besides a chat ID
+_SWEEP_START = object()
+_SWEEP_END = object()
+
+class PostgresStorage(StorageBackend):
+    """
+    PostgreSQL storage for running several bot instances against one database
+
+    Uses an asyncpg connection pool, COPY for bulk archive writes and
+    server-side cursors for unbounded reads.
+    """
+
+    SCHEMA = [
+        '''
+            CREATE TABLE IF NOT EXISTS messages (
+                id BIGSERIAL PRIMARY KEY,
+                chat_id BIGINT,
+                role TEXT,
+                content TEXT,
+                timestamp TIMESTAMP
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id, id)',
+        '''
+            CREATE TABLE IF NOT EXISTS messages_archive (
+                id BIGINT PRIMARY KEY,
+                chat_id BIGINT,
+                role TEXT,
+                timestamp TIMESTAMP,
+                content BYTEA
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_messages_archive_chat_id ON messages_archive (chat_id, id)',
+        '''
+            CREATE TABLE IF NOT EXISTS active_chats (
+                chat_id BIGINT PRIMARY KEY,
+                is_active BOOLEAN DEFAULT TRUE
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS dutch_words (
+                id BIGSERIAL PRIMARY KEY,
+                word TEXT NOT NULL UNIQUE,
+                translation TEXT NOT NULL,
+                date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS chat_settings (
+                chat_id BIGINT,
+                key TEXT,
+                value TEXT,
+                PRIMARY KEY (chat_id, key)
+            )
+        ''',
+        'ALTER TABLE dutch_words ADD COLUMN IF NOT EXISTS usage_example TEXT',
+        # Full-text search: generated tsvectors stay in sync on every insert.
+        # "simple" config since conversations mix Dutch and English
+        '''
+            ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_messages_content_tsv ON messages USING GIN (content_tsv)',
+        '''
+            ALTER TABLE dutch_words ADD COLUMN IF NOT EXISTS search_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple',
+                word || ' ' || translation || ' ' || coalesce(usage_example, ''))) STORED
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_dutch_words_search_tsv ON dutch_words USING GIN (search_tsv)'
+    ]
+
+    def __init__(self, dsn, min_size=2, max_size=10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+        self._sweep_chat = _SWEEP_START
+
+    async def connect(self):
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Serialize schema setup when several instances start at once
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('dutch_bot_schema'))")
+                for statement in self.SCHEMA:
+                    await conn.execute(statement)
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+        self._sweep_chat = _SWEEP_START
+
+    async def store_message(self, chat_id, role, content, timestamp):
+        await self.pool.execute('''
+            INSERT INTO messages (role, content, timestamp, chat_id)
+            VALUES ($1, $2, $3, $4)
+        ''', role, content, timestamp, chat_id)
+
+    async def get_messages(self, chat_id, limit, offset=0):
+        # Separate queries so both cases can use idx_messages_chat_id
+        if chat_id is None:
+            rows = await self.pool.fetch('''
+                SELECT role, content FROM messages
+                WHERE chat_id IS NULL
+                ORDER BY id ASC
+                LIMIT $1 OFFSET $2
+            ''', limit, offset)
+        else:
+            rows = await self.pool.fetch('''
+                SELECT role, content FROM messages
+                WHERE chat_id = $1
+                ORDER BY id ASC
+                LIMIT $2 OFFSET $3
+            ''', chat_id, limit, offset)
+        return [tuple(row) for row in rows]
+
+    async def count_messages(self, chat_id):
+        if chat_id is None:
+            return await self.pool.fetchval('SELECT COUNT(*) FROM messages WHERE chat_id IS NULL')
+        return await self.pool.fetchval('SELECT COUNT(*) FROM messages WHERE chat_id = $1', chat_id)
+
+    async def _expired_rows(self, conn, chat_id, max_rows_per_chat, cutoff, limit):
+        """Oldest expired rows of one chat, walked through idx_messages_chat_id"""
+        # Separate filters so both cases can use idx_messages_chat_id
+        if chat_id is None:
+            chat_filter, args = 'chat_id IS NULL', []
+        else:
+            chat_filter, args = 'chat_id = $1', [chat_id]
+        n = len(args)
+
+        # Rows older than the chat's Nth-newest message are over the row limit
+        newest_kept = await conn.fetchval(f'''
+            SELECT id FROM messages
+            WHERE {chat_filter} AND role != 'system'
+            ORDER BY id DESC
+            LIMIT 1 OFFSET ${n + 1}
+        ''', *args, max_rows_per_chat - 1)
+        # SKIP LOCKED lets several instances run retention side by side
+        return await conn.fetch(f'''
+            SELECT id, chat_id, role, timestamp, content
+            FROM messages
+            WHERE {chat_filter} AND role != 'system' AND (id < ${n + 1} OR timestamp < ${n + 2})
+            ORDER BY id ASC
+            LIMIT ${n + 3}
+            FOR UPDATE SKIP LOCKED
+        ''', *args, newest_kept or 0, cutoff, limit)
+
+    async def archive_expired_messages(self, max_rows_per_chat, cutoff, batch_size, compress):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                rows = []
+                # Visit chats one at a time (the NULL chat first, then by ID
+                # through the index), resuming where the previous batch stopped
+                chat = self._sweep_chat
+                while len(rows) < batch_size and chat is not _SWEEP_END:
+                    chat_id = None if chat is _SWEEP_START else chat
+                    rows.extend(await self._expired_rows(
+                        conn, chat_id, max_rows_per_chat, cutoff, batch_size - len(rows)
+                    ))
+                    if len(rows) >= batch_size:
+                        break
+                    if chat_id is None:
+                        next_chat = await conn.fetchval('SELECT MIN(chat_id) FROM messages')
+                    else:
+                        next_chat = await conn.fetchval('SELECT MIN(chat_id) FROM messages WHERE chat_id > $1', chat_id)
+                    chat = _SWEEP_END if next_chat is None else next_chat
+                self._sweep_chat = chat
+
+                if not rows:
+                    # Sweep finished, the next run starts over
+                    self._sweep_chat = _SWEEP_START
+                    return 0
+
+                ids = [row['id'] for row in rows]
+                # Drop rows a previous, interrupted run already archived
+                await conn.execute('DELETE FROM messages_archive WHERE id = ANY($1::bigint[])', ids)
+                await conn.copy_records_to_table(
+                    'messages_archive',
+                    records=[
+                        (row['id'], row['chat_id'], row['role'], row['timestamp'], compress(row['content'] or ''))
+                        for row in rows
+                    ],
+                    columns=['id', 'chat_id', 'role', 'timestamp', 'content']
+                )
+                await conn.execute('DELETE FROM messages WHERE id = ANY($1::bigint[])', ids)
+        return len(rows)
+
+    async def get_archived_messages(self, chat_id, limit):
+        if chat_id is None:
+            rows = await self.pool.fetch('''
+                SELECT role, content, timestamp FROM messages_archive
+                WHERE chat_id IS NULL
+                ORDER BY id DESC
+                LIMIT $1
+            ''', limit)
+        else:
+            rows = await self.pool.fetch('''
+                SELECT role, content, timestamp FROM messages_archive
+                WHERE chat_id = $1
+                ORDER BY id DESC
+                LIMIT $2
+            ''', chat_id, limit)
+        return [(row['role'], bytes(row['content']), row['timestamp']) for row in rows]
+
+    async def reclaim_space(self):
+        # Plain VACUUM makes dead tuples reusable without locking out writers
+        await self.pool.execute('VACUUM (ANALYZE) messages')
+
+    async def iter_active_chats(self):
+        async with self.pool.acquire() as conn:
+            # Server-side cursors only live inside a transaction
+            async with conn.transaction():
+                async for row in conn.cursor(
+                    'SELECT chat_id FROM active_chats WHERE is_active = TRUE',
+                    prefetch=1000
+                ):
+                    yield row['chat_id']
+
+    async def set_chat_active(self, chat_id, is_active):
+        await self.pool.execute('''
+            INSERT INTO active_chats (chat_id, is_active) VALUES ($1, $2)
+            ON CONFLICT (chat_id) DO UPDATE SET is_active = EXCLUDED.is_active
+        ''', chat_id, is_active)
+
+    async def get_used_words(self, limit):
+        rows = await self.pool.fetch(
+            'SELECT word, translation FROM dutch_words ORDER BY date_added DESC LIMIT $1',
+            limit
+        )
+        return [tuple(row) for row in rows]
+
+    async def store_word(self, word, translation, usage_example=None):
+        try:
+            await self.pool.execute('''
+                INSERT INTO dutch_words (word, translation, usage_example)
+                VALUES ($1, $2, $3)
+            ''', word, translation, usage_example)
+        except asyncpg.UniqueViolationError as e:
+            raise DuplicateWordError(word) from e
+
+    @staticmethod
+    def tsquery(terms):
+        # Terms are plain word tokens, ":*" for prefix matches
+        return ' & '.join(
+            f'{term}:*' if len(term) >= MIN_PREFIX_LENGTH else term
+            for term in terms
+        )
+
+    async def search_messages(self, chat_id, terms, limit):
+        if chat_id is None:
+            rows = await self.pool.fetch('''
+                SELECT role, content, timestamp FROM messages
+                WHERE content_tsv @@ to_tsquery('simple', $1) AND chat_id IS NULL AND role != 'system'
+                ORDER BY id DESC
+                LIMIT $2
+            ''', self.tsquery(terms), limit)
+        else:
+            rows = await self.pool.fetch('''
+                SELECT role, content, timestamp FROM messages
+                WHERE content_tsv @@ to_tsquery('simple', $1) AND chat_id = $2 AND role != 'system'
+                ORDER BY id DESC
+                LIMIT $3
+            ''', self.tsquery(terms), chat_id, limit)
+        return [tuple(row) for row in rows]
+
+    async def search_words(self, terms, limit):
+        rows = await self.pool.fetch('''
+            SELECT word, translation, usage_example, date_added FROM dutch_words
+            WHERE search_tsv @@ to_tsquery('simple', $1)
+            ORDER BY id DESC
+            LIMIT $2
+        ''', self.tsquery(terms), limit)
+        return [tuple(row) for row in rows]
+
+    async def get_setting(self, chat_id, key, default=None):
+        value = await self.pool.fetchval(
+            'SELECT value FROM chat_settings WHERE chat_id = $1 AND key = $2',
+            chat_id, key
+        )
+        return value if value is not None else default
+
+    async def set_setting(self, chat_id, key, value):
+        await self.pool.execute('''
+            INSERT INTO chat_settings (chat_id, key, value) VALUES ($1, $2, $3)
+            ON CONFLICT (chat_id, key) DO UPDATE SET value = EXCLUDED.value
+        ''', chat_id, key, value)
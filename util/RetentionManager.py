@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import zlib
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+class RetentionManager:
+    """Keeps the live messages table small by archiving and deleting old turns
+
+    Rows beyond the newest `max_rows_per_chat` of a chat, or older than
+    `max_age_days`, are moved to `messages_archive` with their content
+    zlib-compressed. System prompts are never expired.
+    """
+
+    def __init__(self, storage, max_rows_per_chat=500, max_age_days=90, batch_size=500):
+        self.storage = storage
+        self.max_rows_per_chat = max_rows_per_chat
+        self.max_age_days = max_age_days
+        self.batch_size = batch_size
+        self.compression_level = 9
+
+    def compress(self, content):
+        return zlib.compress(content.encode('utf-8'), self.compression_level)
+
+    async def enforce_retention(self, context=None):
+        """Job callback: archive expired rows in small batches, then reclaim free pages"""
+        cutoff = datetime.now() - timedelta(days=self.max_age_days)
+        total = 0
+        try:
+            while True:
+                moved = await self.storage.archive_expired_messages(
+                    self.max_rows_per_chat, cutoff, self.batch_size, self.compress
+                )
+                if not moved:
+                    break
+                total += moved
+                # Yield between batches so a long backlog is interleaved with handlers
+                await asyncio.sleep(0)
+
+            await self.storage.reclaim_space()
+        except Exception as e:
+            logger.error(f"Error enforcing retention: {e}")
+
+        if total:
+            logger.info(f"Archived {total} messages past retention limits")
+        return total
+
+    async def get_archived_messages(self, chat_id=None, limit=100):
+        """Read back archived turns for a chat, newest first, decompressed"""
+        rows = await self.storage.get_archived_messages(chat_id, limit)
+
+        return [
+            {"role": role, "content": zlib.decompress(content).decode('utf-8'), "timestamp": timestamp}
+            for role, content, timestamp in rows
+        ]
@@ -0,0 +1,407 @@
+import asyncio
+import sqlite3
+import logging
+import threading
+from util.StorageBackend import StorageBackend, DuplicateWordError, MIN_PREFIX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+def run_migrations(conn, statements, versioned=()):
+    """Apply schema statements atomically: either all of them land or none do
+
+    Args:
+        conn (sqlite3.Connection): Connection opened with isolation_level=None
+        statements (iterable): Idempotent statements (CREATE ... IF NOT EXISTS)
+        versioned (sequence): Non-idempotent statements (e.g. ALTER TABLE),
+            applied once each, tracked through PRAGMA user_version
+    """
+    try:
+        conn.execute('BEGIN')
+        for statement in statements:
+            conn.execute(statement)
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for statement in versioned[version:]:
+            conn.execute(statement)
+        if len(versioned) > version:
+            conn.execute(f'PRAGMA user_version = {len(versioned)}')
+        conn.execute('COMMIT')
+    except sqlite3.Error:
+        conn.execute('ROLLBACK')
+        raise
+
+def chat_token(chat_id):
+    """FTS token of a chat ID, must match CHAT_TOKEN_SQL"""
+    if chat_id is None:
+        return 'cnull'
+    return 'c' + str(chat_id).replace('-', 'n')
+
+# SQL version of chat_token() for a row alias ("new" or "old"); the prefix
+# keeps tokens of negative (group) chat IDs from matching positive ones
+CHAT_TOKEN_SQL = "CASE WHEN {row}.chat_id IS NULL THEN 'cnull' ELSE 'c' || replace({row}.chat_id, '-', 'n') END"
+
+# Positions of the retention sweep besides a chat ID
+_SWEEP_START = object()
+_SWEEP_END = object()
+
+class SQLiteStorage(StorageBackend):
+    """
+    Single-file storage, the default for single-host deployments
+
+    sqlite3 calls block, so every call runs in an asyncio.to_thread worker on
+    that worker's own connection. WAL lets them read in parallel while one
+    of them writes.
+    """
+
+    SCHEMA = [
+        '''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                role TEXT,
+                content TEXT,
+                timestamp DATETIME
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS messages_archive (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER,
+                role TEXT,
+                timestamp DATETIME,
+                content BLOB
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_messages_archive_chat_id ON messages_archive (chat_id, id)',
+        '''
+            CREATE TABLE IF NOT EXISTS active_chats (
+                chat_id INTEGER PRIMARY KEY,
+                is_active BOOLEAN DEFAULT TRUE
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS dutch_words (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                word TEXT NOT NULL UNIQUE,
+                translation TEXT NOT NULL,
+                date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS chat_settings (
+                chat_id INTEGER,
+                key TEXT,
+                value TEXT,
+                PRIMARY KEY (chat_id, key)
+            )
+        '''
+    ]
+
+    # Applied in order, once per database; append only, never reorder
+    MIGRATIONS = [
+        'ALTER TABLE messages ADD COLUMN chat_id INTEGER',
+        'CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id, id)',
+        'ALTER TABLE dutch_words ADD COLUMN usage_example TEXT',
+        # Full-text index of messages, with the chat as a token column so the
+        # per-chat filter runs inside FTS5. Contentless, since the chat token
+        # isn't a column of messages; system prompts are left out of it
+        '''
+            CREATE VIRTUAL TABLE messages_fts USING fts5(
+                content, chat,
+                content='',
+                prefix='2 3',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''',
+        f'''
+            CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages
+            WHEN new.role IS NOT 'system' BEGIN
+                INSERT INTO messages_fts (rowid, content, chat)
+                VALUES (new.id, new.content, {CHAT_TOKEN_SQL.format(row='new')});
+            END
+        ''',
+        f'''
+            CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages
+            WHEN old.role IS NOT 'system' BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content, chat)
+                VALUES ('delete', old.id, old.content, {CHAT_TOKEN_SQL.format(row='old')});
+            END
+        ''',
+        # Contentless tables can't 'rebuild', backfill from messages instead
+        f'''
+            INSERT INTO messages_fts (rowid, content, chat)
+            SELECT id, content, {CHAT_TOKEN_SQL.format(row='messages')}
+            FROM messages WHERE role IS NOT 'system'
+        ''',
+        # Full-text index over the words' own rows (external content), kept
+        # in sync by triggers and backfilled once with 'rebuild'
+        '''
+            CREATE VIRTUAL TABLE dutch_words_fts USING fts5(
+                word, translation, usage_example,
+                content='dutch_words', content_rowid='id',
+                prefix='2 3',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''',
+        '''
+            CREATE TRIGGER dutch_words_fts_insert AFTER INSERT ON dutch_words BEGIN
+                INSERT INTO dutch_words_fts (rowid, word, translation, usage_example)
+                VALUES (new.id, new.word, new.translation, new.usage_example);
+            END
+        ''',
+        '''
+            CREATE TRIGGER dutch_words_fts_delete AFTER DELETE ON dutch_words BEGIN
+                INSERT INTO dutch_words_fts (dutch_words_fts, rowid, word, translation, usage_example)
+                VALUES ('delete', old.id, old.word, old.translation, old.usage_example);
+            END
+        ''',
+        "INSERT INTO dutch_words_fts (dutch_words_fts) VALUES ('rebuild')",
+    ]
+
+    # PRAGMA auto_vacuum value for INCREMENTAL
+    AUTO_VACUUM_INCREMENTAL = 2
+
+    def __init__(self, db_name='chat_history.db', vacuum_pages=1000, busy_timeout=30):
+        self.db_name = db_name
+        self.vacuum_pages = vacuum_pages
+        # Seconds a write waits for another connection's write to finish
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._sweep_chat = _SWEEP_START
+
+    async def connect(self):
+        await asyncio.to_thread(self._setup)
+
+    def _setup(self):
+        conn = self._worker_connection()
+        # Only takes effect on a new, empty database
+        conn.execute(f'PRAGMA auto_vacuum = {self.AUTO_VACUUM_INCREMENTAL}')
+        # WAL so handlers can keep reading while maintenance writes
+        conn.execute('PRAGMA journal_mode = WAL')
+        run_migrations(conn, self.SCHEMA, self.MIGRATIONS)
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != self.AUTO_VACUUM_INCREMENTAL:
+            # Switching an existing database needs a one-off full VACUUM. It
+            # locks the whole file, so it runs here, before any update is handled
+            logger.info("Enabling incremental auto-vacuum, running one-off VACUUM")
+            conn.execute(f'PRAGMA auto_vacuum = {self.AUTO_VACUUM_INCREMENTAL}')
+            conn.execute('VACUUM')
+
+    async def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def _worker_connection(self):
+        """The calling worker thread's connection, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode: multi-statement writes use explicit BEGIN/COMMIT.
+            # Closed from the event loop thread in close()
+            conn = sqlite3.connect(
+                self.db_name, isolation_level=None, timeout=self.busy_timeout, check_same_thread=False
+            )
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _query(self, sql, params, fetch):
+        cursor = self._worker_connection().execute(sql, params)
+        return fetch(cursor) if fetch else None
+
+    async def _execute(self, sql, params=()):
+        await asyncio.to_thread(self._query, sql, params, None)
+
+    async def _fetchone(self, sql, params=()):
+        return await asyncio.to_thread(self._query, sql, params, sqlite3.Cursor.fetchone)
+
+    async def _fetchall(self, sql, params=()):
+        return await asyncio.to_thread(self._query, sql, params, sqlite3.Cursor.fetchall)
+
+    async def store_message(self, chat_id, role, content, timestamp):
+        await self._execute('''
+            INSERT INTO messages (role, content, timestamp, chat_id)
+            VALUES (?, ?, ?, ?)
+        ''', (role, content, timestamp.isoformat(), chat_id))
+
+    async def get_messages(self, chat_id, limit, offset=0):
+        # "IS" so that chat_id=None matches rows stored before chats were tracked
+        return await self._fetchall('''
+            SELECT role, content
+            FROM messages
+            WHERE chat_id IS ?
+            ORDER BY id ASC
+            LIMIT ? OFFSET ?
+        ''', (chat_id, limit, offset))
+
+    async def count_messages(self, chat_id):
+        row = await self._fetchone('SELECT COUNT(*) FROM messages WHERE chat_id IS ?', (chat_id,))
+        return row[0]
+
+    async def archive_expired_messages(self, max_rows_per_chat, cutoff, batch_size, compress):
+        return await asyncio.to_thread(
+            self._archive_expired_batch, max_rows_per_chat, cutoff.isoformat(), batch_size, compress
+        )
+
+    def _expired_rows(self, conn, chat_id, max_rows_per_chat, cutoff, limit):
+        """Oldest expired rows of one chat, walked through idx_messages_chat_id"""
+        # Rows older than the chat's Nth-newest message are over the row limit
+        newest_kept = conn.execute('''
+            SELECT id FROM messages
+            WHERE chat_id IS ? AND role != 'system'
+            ORDER BY id DESC
+            LIMIT 1 OFFSET ?
+        ''', (chat_id, max_rows_per_chat - 1)).fetchone()
+        return conn.execute('''
+            SELECT id, chat_id, role, timestamp, content
+            FROM messages
+            WHERE chat_id IS ? AND role != 'system' AND (id < ? OR timestamp < ?)
+            ORDER BY id ASC
+            LIMIT ?
+        ''', (chat_id, newest_kept[0] if newest_kept else 0, cutoff, limit)).fetchall()
+
+    def _archive_expired_batch(self, max_rows_per_chat, cutoff, batch_size, compress):
+        conn = self._worker_connection()
+        rows = []
+
+        # Visit chats one at a time (the NULL chat first, then by ID through
+        # the index), resuming where the previous batch stopped
+        chat = self._sweep_chat
+        while len(rows) < batch_size and chat is not _SWEEP_END:
+            chat_id = None if chat is _SWEEP_START else chat
+            rows.extend(self._expired_rows(conn, chat_id, max_rows_per_chat, cutoff, batch_size - len(rows)))
+            if len(rows) >= batch_size:
+                break
+            if chat_id is None:
+                next_chat = conn.execute('SELECT MIN(chat_id) FROM messages').fetchone()[0]
+            else:
+                next_chat = conn.execute('SELECT MIN(chat_id) FROM messages WHERE chat_id > ?', (chat_id,)).fetchone()[0]
+            chat = _SWEEP_END if next_chat is None else next_chat
+        self._sweep_chat = chat
+
+        if not rows:
+            # Sweep finished, the next run starts over
+            self._sweep_chat = _SWEEP_START
+            return 0
+
+        try:
+            conn.execute('BEGIN')
+            conn.executemany('''
+                INSERT OR REPLACE INTO messages_archive (id, chat_id, role, timestamp, content)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (row_id, chat_id, role, timestamp, compress(content or ''))
+                for row_id, chat_id, role, timestamp, content in rows
+            ])
+            conn.executemany('DELETE FROM messages WHERE id = ?', [(row[0],) for row in rows])
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    async def get_archived_messages(self, chat_id, limit):
+        return await self._fetchall('''
+            SELECT role, content, timestamp
+            FROM messages_archive
+            WHERE chat_id IS ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (chat_id, limit))
+
+    async def reclaim_space(self):
+        await asyncio.to_thread(self._reclaim_space)
+
+    def _reclaim_space(self):
+        # connect() has switched the database to incremental auto-vacuum.
+        # Each step of this pragma frees one page, so it must be fully fetched
+        self._worker_connection().execute(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})').fetchall()
+
+    async def iter_active_chats(self, page_size=1000):
+        # Pages by chat ID (the rowid), so each page is a range lookup and no
+        # cursor has to stay open across worker threads
+        rows = await self._fetchall('''
+            SELECT chat_id FROM active_chats WHERE is_active = TRUE
+            ORDER BY chat_id LIMIT ?
+        ''', (page_size,))
+        while rows:
+            for row in rows:
+                yield row[0]
+            rows = await self._fetchall('''
+                SELECT chat_id FROM active_chats WHERE is_active = TRUE AND chat_id > ?
+                ORDER BY chat_id LIMIT ?
+            ''', (rows[-1][0], page_size))
+
+    async def set_chat_active(self, chat_id, is_active):
+        await self._execute(
+            'INSERT OR REPLACE INTO active_chats (chat_id, is_active) VALUES (?, ?)',
+            (chat_id, is_active)
+        )
+
+    async def get_used_words(self, limit):
+        return await self._fetchall(
+            'SELECT word, translation FROM dutch_words ORDER BY date_added DESC LIMIT ?',
+            (limit,)
+        )
+
+    async def store_word(self, word, translation, usage_example=None):
+        try:
+            await self._execute('''
+                INSERT INTO dutch_words (word, translation, usage_example)
+                VALUES (?, ?, ?)
+            ''', (word, translation, usage_example))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateWordError(word) from e
+
+    @staticmethod
+    def fts_query(terms):
+        # Quoted so user input can't inject FTS syntax, "*" for prefix matches
+        # (served from the tables' 2 and 3 character prefix indexes)
+        return ' '.join(
+            f'"{term}"*' if len(term) >= MIN_PREFIX_LENGTH else f'"{term}"'
+            for term in terms
+        )
+
+    async def search_messages(self, chat_id, terms, limit):
+        # The chat filter is part of the MATCH, and newest first by rowid
+        # lets FTS5 stop as soon as it has `limit` rows of this chat
+        match = f'chat : "{chat_token(chat_id)}" AND content : ({self.fts_query(terms)})'
+        return await asyncio.to_thread(self._search_messages, match, limit)
+
+    def _search_messages(self, match, limit):
+        return self._worker_connection().execute('''
+            SELECT m.role, m.content, m.timestamp
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?
+            ORDER BY messages_fts.rowid DESC
+            LIMIT ?
+        ''', (match, limit)).fetchall()
+
+    async def search_words(self, terms, limit):
+        return await asyncio.to_thread(self._search_words, self.fts_query(terms), limit)
+
+    def _search_words(self, match, limit):
+        return self._worker_connection().execute('''
+            SELECT w.word, w.translation, w.usage_example, w.date_added
+            FROM dutch_words_fts
+            JOIN dutch_words w ON w.id = dutch_words_fts.rowid
+            WHERE dutch_words_fts MATCH ?
+            ORDER BY dutch_words_fts.rowid DESC
+            LIMIT ?
+        ''', (match, limit)).fetchall()
+
+    async def get_setting(self, chat_id, key, default=None):
+        row = await self._fetchone(
+            'SELECT value FROM chat_settings WHERE chat_id = ? AND key = ?',
+            (chat_id, key)
+        )
+        return row[0] if row else default
+
+    async def set_setting(self, chat_id, key, value):
+        await self._execute(
+            'INSERT OR REPLACE INTO chat_settings (chat_id, key, value) VALUES (?, ?, ?)',
+            (chat_id, key, value)
+        )
@@ -0,0 +1,113 @@
+import re
+import logging
+from util.StorageBackend import search_terms
+
+logger = logging.getLogger(__name__)
+
+# Past-tense questions about earlier vocabulary, the same phrasings in
+# English and Dutch: "what was the word for ...", "which words did we ...".
+# Present-tense ones ("what is the word for ...?") are ordinary vocabulary
+# questions for the tutor
+RECALL_PATTERN = re.compile(
+    r"\b(what|which) (was|were) (that|those|the) words?\b"
+    r"|\b(what|which) words? (did|have|had) we\b"
+    r"|\b(wat|welk|welke) (was|waren) (dat|het|die|de) woord(en)?\b"
+    r"|\b(welk|welke|wat voor) woord(en)? (hebben|hadden) (we|wij)\b",
+    re.IGNORECASE
+)
+
+# Text before a phrase that starts a sentence
+SENTENCE_START = re.compile(r"(^|[.!?])\W*$")
+
+# Words of a recall question that say nothing about the word being looked for
+RECALL_STOPWORDS = {
+    "what", "which", "was", "were", "is", "are", "that", "the", "those", "word", "words",
+    "we", "did", "do", "does", "learn", "learned", "learnt", "had", "have", "practiced",
+    "practised", "covered", "last", "week", "yesterday", "month", "time", "again", "a",
+    "an", "of", "for", "in", "on", "about", "it", "me", "remind", "you", "i", "my",
+    "wat", "waren", "zijn", "dat", "het", "die", "de", "woord", "woorden", "welk", "welke",
+    "hebben", "hadden", "geleerd", "gehad", "gedaan", "geoefend", "vorige", "week", "gisteren", "maand", "ook", "alweer",
+    "weer", "voor", "van", "een", "wij", "we", "jij", "ik", "mij"
+}
+
+class SearchManager:
+    """Answers searches and vocabulary recall questions from the full-text indexes"""
+
+    def __init__(self, storage, result_limit=5, recent_words_limit=10, preview_length=150):
+        self.storage = storage
+        self.result_limit = result_limit
+        self.recent_words_limit = recent_words_limit
+        self.preview_length = preview_length
+
+    def is_recall_query(self, text):
+        """True for a recall phrase that starts a sentence or is asked as a question"""
+        match = RECALL_PATTERN.search(text)
+        if not match:
+            return False
+        return bool(SENTENCE_START.search(text[:match.start()])) or "?" in text[match.end():]
+
+    def format_words(self, words):
+        lines = []
+        for word in words:
+            line = f"• {word[0]} - {word[1]}"
+            if len(word) > 2 and word[2]:
+                line += f"\n  {word[2]}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def format_messages(self, messages):
+        lines = []
+        for role, content, timestamp in messages:
+            preview = " ".join(content.split())
+            if len(preview) > self.preview_length:
+                preview = preview[:self.preview_length] + "..."
+            who = "You" if role == "user" else "Tutor"
+            lines.append(f"• {who}: {preview}")
+        return "\n".join(lines)
+
+    async def search(self, chat_id, query):
+        """Search learned words and this chat's history, returns the reply text"""
+        terms = search_terms(query)
+        if not terms:
+            return "Usage: /search <word or phrase>"
+
+        words = await self.storage.search_words(terms, self.result_limit)
+        messages = await self.storage.search_messages(chat_id, terms, self.result_limit)
+
+        if not words and not messages:
+            return f"Nothing found for \"{query}\"."
+
+        sections = []
+        if words:
+            sections.append("📚 Words of the day:\n" + self.format_words(words))
+        if messages:
+            sections.append("💬 From our conversations:\n" + self.format_messages(messages))
+        return "\n\n".join(sections)
+
+    async def answer_recall(self, text):
+        """
+        Answer a vocabulary recall question from the word index
+
+        Only learned words are looked up. Matching old messages are not a
+        good enough answer to skip the tutor, so those are left to /search.
+
+        Returns:
+            str: The reply, or None if the question isn't a recall question
+                or no word matched, in which case the tutor model should answer
+        """
+        if not self.is_recall_query(text):
+            return None
+
+        terms = [term for term in search_terms(text) if term not in RECALL_STOPWORDS]
+        if not terms:
+            # No hint about the word itself, list the most recent ones
+            words = await self.storage.get_used_words(self.recent_words_limit)
+            if not words:
+                return None
+            return "📚 Recent words of the day:\n" + self.format_words(words)
+
+        words = await self.storage.search_words(terms, self.result_limit)
+        if words:
+            return "📚 Matching words of the day:\n" + self.format_words(words)
+
+        return None
@@ -0,0 +1,165 @@
+import os
+import re
+import logging
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+class StorageError(Exception):
+    """Base class for errors raised by storage backends"""
+
+class DuplicateWordError(StorageError):
+    """Raised when storing a Dutch word that was already used"""
+
+def search_terms(text, max_terms=8):
+    """Split free text into the word tokens used for full-text queries"""
+    return re.findall(r'\w+', text.lower())[:max_terms]
+
+# Shorter terms are matched as whole words: a one-letter prefix expands to
+# a large share of the index and makes the query scan most of it
+MIN_PREFIX_LENGTH = 2
+
+class StorageBackend(ABC):
+    """
+    Interface for everything the bot persists: chat messages (and their
+    archive), word of the day subscriptions, used words and per-chat settings.
+
+    Timestamps are passed in as datetime objects; each backend decides how
+    to store them.
+    """
+
+    @abstractmethod
+    async def connect(self):
+        """Open connections and create the schema"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self):
+        """Release connections"""
+        raise NotImplementedError
+
+    # Messages
+
+    @abstractmethod
+    async def store_message(self, chat_id, role, content, timestamp):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_messages(self, chat_id, limit, offset=0):
+        """Return up to `limit` (role, content) tuples of a chat in insertion order, skipping `offset`"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_messages(self, chat_id):
+        """Return the number of live (not archived) messages of a chat"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def archive_expired_messages(self, max_rows_per_chat, cutoff, batch_size, compress):
+        """
+        Move one batch of expired non-system messages to the archive
+
+        A message is expired when it is not among the newest `max_rows_per_chat`
+        of its chat, or was stored before `cutoff`.
+
+        Args:
+            compress (callable): Turns message content (str) into the archived bytes
+
+        Returns:
+            int: Number of messages moved, 0 once nothing is left to expire
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_archived_messages(self, chat_id, limit):
+        """Return up to `limit` (role, compressed content, timestamp) tuples, newest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def reclaim_space(self):
+        """Give space freed by archived messages back to the database"""
+        raise NotImplementedError
+
+    # Word of the day subscriptions
+
+    @abstractmethod
+    def iter_active_chats(self):
+        """Return an async iterator over the chat IDs subscribed to the word of the day"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_chat_active(self, chat_id, is_active):
+        raise NotImplementedError
+
+    # Dutch words
+
+    @abstractmethod
+    async def get_used_words(self, limit):
+        """Return up to `limit` (word, translation) tuples, most recent first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def store_word(self, word, translation, usage_example=None):
+        """Store a used word, raises DuplicateWordError if it already exists"""
+        raise NotImplementedError
+
+    # Full-text search, kept in sync as rows are inserted and deleted
+
+    @abstractmethod
+    async def search_messages(self, chat_id, terms, limit):
+        """
+        Find a chat's user and assistant messages containing all `terms`
+
+        Terms of at least MIN_PREFIX_LENGTH characters match as word prefixes.
+
+        Returns:
+            list: Up to `limit` (role, content, timestamp) tuples, newest first
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search_words(self, terms, limit):
+        """
+        Find used words whose word, translation or example contain all `terms`,
+        matched like in search_messages
+
+        Returns:
+            list: Up to `limit` (word, translation, usage_example, date_added) tuples, newest first
+        """
+        raise NotImplementedError
+
+    # Per-chat settings
+
+    @abstractmethod
+    async def get_setting(self, chat_id, key, default=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_setting(self, chat_id, key, value):
+        raise NotImplementedError
+
+def create_storage_backend(backend=None):
+    """
+    Build the storage backend selected by configuration
+
+    STORAGE_BACKEND picks the implementation ("sqlite" by default, or
+    "postgres"). SQLite reads its file from SQLITE_PATH, PostgreSQL connects
+    to DATABASE_URL with a pool of DATABASE_POOL_MIN_SIZE..DATABASE_POOL_MAX_SIZE
+    connections.
+    """
+    backend = (backend or os.getenv('STORAGE_BACKEND', 'sqlite')).lower()
+
+    if backend == 'sqlite':
+        from util.SQLiteStorage import SQLiteStorage
+        return SQLiteStorage(os.getenv('SQLITE_PATH', 'chat_history.db'))
+
+    if backend in ('postgres', 'postgresql'):
+        # Imported lazily so asyncpg is only needed when PostgreSQL is used
+        from util.PostgresStorage import PostgresStorage
+        return PostgresStorage(
+            dsn=os.getenv('DATABASE_URL'),
+            min_size=int(os.getenv('DATABASE_POOL_MIN_SIZE', 2)),
+            max_size=int(os.getenv('DATABASE_POOL_MAX_SIZE', 10))
+        )
+
+    raise ValueError(f"Unknown storage backend: {backend}")